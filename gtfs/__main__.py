@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 """Command line interface for fetching GTFS."""
+import json
 import logging
+import os
 from typing import Optional
 
 import typer
@@ -9,8 +11,14 @@ from typing_extensions import Annotated
 
 from .feed_source import FeedSource
 from .feed_sources import feed_sources
+from .utils.check_status import WARN_DAYS
 from .utils.constants import Predicate, spinner
+from .utils.extend_effective_dates import EFFECTIVE_DAYS
 from .utils.geom import Bbox, bbox_contains_bbox, bbox_intersects_bbox
+from .utils.pipeline import run_pipeline
+from .utils.plan import plan_feeds
+
+DOWNLOAD_DIRECTORY = "gtfs"
 
 logging.basicConfig()
 LOG = logging.getLogger()
@@ -110,32 +118,147 @@ def list_feeds(
             print("\n" + pretty_output.get_string())
 
 
+def print_plan(sources, download_directory: str, as_json: bool) -> None:
+    """Print which feeds would be downloaded and how many bytes that would transfer."""
+    plans = plan_feeds(sources, download_directory)
+    total_bytes = sum(plan["size"] or 0 for plan in plans if plan["is_new"])
+    # new feeds whose server did not report a size are missing from the estimate
+    unknown_size = len([plan for plan in plans if plan["is_new"] and plan["size"] is None])
+    skipped = len([plan for plan in plans if plan["skipped"]])
+
+    if as_json:
+        print(
+            json.dumps(
+                {
+                    "feeds": plans,
+                    "total_bytes": total_bytes,
+                    "unknown_size": unknown_size,
+                    "skipped": skipped,
+                },
+                indent=2,
+            )
+        )
+        return
+
+    ptable = ColorTable(["feed", "new?", "size", "error"], theme=Themes.OCEAN, hrules=1)
+    for plan in plans:
+        ptable.add_row(
+            [
+                plan["feed"],
+                "x" if plan["is_new"] else "",
+                "" if plan["size"] is None else plan["size"],
+                plan["error"] or (f"skipped: {plan['skipped']}" if plan["skipped"] else ""),
+            ]
+        )
+    print("\n" + ptable.get_string())
+    print(f"Estimated bytes to transfer: {total_bytes}")
+    if unknown_size:
+        print(f"Not included: {unknown_size} new feed(s) of unknown size")
+    if skipped:
+        print(f"Not checked: {skipped} skipped feed(s)")
+
+
 @app.command()
-def fetch_feeds(sources=None):
+def fetch_feeds(
+    sources=None,
+    plan: Annotated[
+        bool,
+        typer.Option(
+            "--plan",
+            "-p",
+            help="only check which feeds have new data with HEAD requests, without downloading; "
+            "compares with the validators recorded by --pipeline runs",
+        ),
+    ] = False,
+    as_json: Annotated[
+        bool,
+        typer.Option(
+            "--json",
+            "-j",
+            help="print the plan as JSON instead of a pretty table",
+        ),
+    ] = False,
+    download_directory: Annotated[
+        str,
+        typer.Option(
+            "--download-directory",
+            "-d",
+            help=f"full path to the feeds and status files (default: ./{DOWNLOAD_DIRECTORY}/)",
+        ),
+    ] = os.path.join(os.getcwd(), DOWNLOAD_DIRECTORY),
+    pipeline: Annotated[
+        bool,
+        typer.Option(
+            "--pipeline",
+            help="validate, inspect and extend each feed in memory as soon as it is downloaded; "
+            "skips feeds which override fetch",
+        ),
+    ] = False,
+    extend_days: Annotated[
+        Optional[int],
+        typer.Option(
+            "--extend-days",
+            "-e",
+            min=1,
+            help=f"with --pipeline, extend feeds into past and future (default: {EFFECTIVE_DAYS} days)",
+        ),
+    ] = None,
+    warn_expiry_days: Annotated[
+        Optional[int],
+        typer.Option(
+            "--warn-expiry-days",
+            "-w",
+            help=f"with --pipeline, warn if a feed expires within this many days (default: {WARN_DAYS})",
+        ),
+    ] = None,
+) -> None:
     """
     :param sources: List of :FeedSource: modules to fetch; if not set, will fetch all available.
     """
+    if plan is True and pipeline is True:
+        raise typer.BadParameter("Please pass either --plan or --pipeline, not both!")
+    elif as_json is True and plan is False:
+        raise typer.BadParameter("Please pass --plan if you want to print the plan as JSON!")
+    elif (extend_days is not None or warn_expiry_days is not None) and pipeline is False:
+        raise typer.BadParameter(
+            "Please pass --pipeline if you want to extend feeds or warn about their expiry!"
+        )
+
     statuses = {}  # collect the statuses for all the files
 
     # default to use all of them
     if not sources:
         sources = feed_sources
 
+    if plan is True:
+        print_plan(sources, download_directory, as_json)
+        return
+
     LOG.info("Going to fetch feeds from sources: %s", sources)
-    for src in sources:
-        LOG.debug("Going to start fetch for %s...", src)
-        try:
-            if issubclass(src, FeedSource):
-                inst = src()
-                inst.fetch()
-                statuses.update(inst.status)
-            else:
-                LOG.warning(
-                    "Skipping class %s, which does not subclass FeedSource.",
-                    src.__name__,
-                )
-        except AttributeError:
-            LOG.error("Skipping feed %s, which could not be found.", src)
+    if pipeline is True:
+        statuses.update(
+            run_pipeline(
+                sources,
+                download_directory,
+                EFFECTIVE_DAYS if extend_days is None else extend_days,
+                WARN_DAYS if warn_expiry_days is None else warn_expiry_days,
+            )
+        )
+    else:
+        for src in sources:
+            LOG.debug("Going to start fetch for %s...", src)
+            try:
+                if issubclass(src, FeedSource):
+                    inst = src()
+                    inst.fetch()
+                    statuses.update(inst.status)
+                else:
+                    LOG.warning(
+                        "Skipping class %s, which does not subclass FeedSource.",
+                        src.__name__,
+                    )
+            except AttributeError:
+                LOG.error("Skipping feed %s, which could not be found.", src)
 
     # remove last check key set at top level of each status dictionary
     if "last_check" in statuses:
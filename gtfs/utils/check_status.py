@@ -26,7 +26,7 @@ def check_current(file_name, stat, warn_days):
             LOG.warn("Feed %s not effective until %s.", file_name, stat["effective_from"])
             return False
         elif stat["effective_to"] < today:
-            LOG.warn("Feed %s expired %s.", file_name, stat["efective_to"])
+            LOG.warn("Feed %s expired %s.", file_name, stat["effective_to"])
             return False
         elif stat["effective_to"] <= (today + timedelta(days=warn_days)):
             LOG.warn("Feed %s will expire %s.", file_name, stat["effective_to"])
@@ -2,6 +2,7 @@
 """Command line interface for extending feed effective dates."""
 import argparse
 import csv
+import io
 import logging
 import os
 import shutil
@@ -76,6 +77,42 @@ def extend_feed(feed_path, effective_days):
     shutil.rmtree(tmpdir)
 
 
+def extend_feed_zip(feedzip, extended_path, effective_days):
+    """Extend effective date range of an already opened feed, without extracting it to disk.
+
+    :param feedzip: Open :zipfile.ZipFile: of the GTFS to extend
+    :param extended_path: Full path the extended GTFS will be written to
+    :param effective_days: Number of days from today the feed should extend into future and past
+    :returns True if the extended feed was written, False if the feed does not need extension
+    """
+    file_name = os.path.basename(extended_path)
+    if "calendar.txt" not in feedzip.namelist():
+        LOG.warning("Feed %s has no calendar.txt; cannot extend effective date range.", file_name)
+        return False
+
+    with io.TextIOWrapper(feedzip.open("calendar.txt"), encoding="utf-8-sig") as cal_file:
+        csvdict = csv.DictReader(cal_file, skipinitialspace=True)
+        fldnames = csvdict.fieldnames
+        cal = [x for x in csvdict]
+    cal = extended_calendar(cal, effective_days)
+    if not cal:
+        LOG.info("Feed %s does not need extension.", file_name)
+        return False
+
+    cal_file = io.StringIO()
+    csvdict = csv.DictWriter(cal_file, fieldnames=fldnames)
+    csvdict.writeheader()
+    csvdict.writerows(cal)
+    with zipfile.ZipFile(extended_path, "w", zipfile.ZIP_DEFLATED) as extzip:
+        for info in feedzip.infolist():
+            if info.filename == "calendar.txt":
+                extzip.writestr("calendar.txt", cal_file.getvalue())
+            elif info.filename.endswith(".txt"):
+                extzip.writestr(info.filename, feedzip.read(info))
+    LOG.info("Done writing extended feed %s.", file_name)
+    return True
+
+
 def extend_feeds(feed_directory, effective_days):
     """Extend effective dates for all fees found in given directory.
 
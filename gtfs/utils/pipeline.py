@@ -0,0 +1,343 @@
+"""Fetch, validate, inspect and extend feeds in a single streaming pass.
+
+Each downloaded feed is kept in memory and handed to the processing workers through a bounded
+queue, so that validation, stats and bbox extraction and effective date extension of one feed
+overlap with the download of others, and a downloaded zip is never read back from disk.
+Unchanged feeds are only reopened to re-extend them once the extension window has moved.
+"""
+import csv
+import io
+import logging
+import os
+import pickle
+import queue
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from .check_status import WARN_DAYS, check_current
+from .extend_effective_dates import EFFECTIVE_DAYS, GTFS_DATE_FMT, extend_feed_zip
+from .geom import Bbox
+from .plan import conditional_headers, is_new, read_last_status, skip_reason, status_path
+
+# seconds to wait for the server to respond to a download request
+TIMEOUT = 60
+# number of feeds downloaded at once
+DOWNLOAD_WORKERS = 8
+# number of feeds processed at once
+PROCESS_WORKERS = 2
+# number of downloaded feeds held in memory waiting to be processed
+QUEUE_SIZE = 4
+
+REQUIRED_FILES = ["agency.txt", "stops.txt", "routes.txt", "trips.txt", "stop_times.txt"]
+# feeds need at least one of these to define service dates
+CALENDAR_FILES = ["calendar.txt", "calendar_dates.txt"]
+# files whose rows are counted for the feed stats
+STATS_FILES = ["agency.txt", "routes.txt", "trips.txt", "stops.txt"]
+
+LOG = logging.getLogger()
+
+
+def read_csv(feedzip: zipfile.ZipFile, file_name: str):
+    """Iterate over the rows of a GTFS file inside an open feed zip."""
+    with io.TextIOWrapper(feedzip.open(file_name), encoding="utf-8-sig") as csv_file:
+        for row in csv.DictReader(csv_file, skipinitialspace=True):
+            yield row
+
+
+def stops_bbox(feedzip: zipfile.ZipFile) -> Optional[Bbox]:
+    """Bounding box of all stops in the feed, or None if there are no located stops."""
+    lons, lats = [], []
+    for stop in read_csv(feedzip, "stops.txt"):
+        if stop.get("stop_lon") and stop.get("stop_lat"):
+            lons.append(float(stop["stop_lon"]))
+            lats.append(float(stop["stop_lat"]))
+    if not lons:
+        return None
+    return Bbox(min(lons), min(lats), max(lons), max(lats))
+
+
+def effective_dates(feedzip: zipfile.ZipFile) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Earliest and latest service dates found in the feed's calendar files."""
+    names = feedzip.namelist()
+    dates = []
+    if "calendar.txt" in names:
+        for entry in read_csv(feedzip, "calendar.txt"):
+            dates.append(datetime.strptime(entry["start_date"], GTFS_DATE_FMT))
+            dates.append(datetime.strptime(entry["end_date"], GTFS_DATE_FMT))
+    if "calendar_dates.txt" in names:
+        for entry in read_csv(feedzip, "calendar_dates.txt"):
+            # exception type 1 adds service on the date, 2 removes it
+            if entry.get("exception_type") == "1":
+                dates.append(datetime.strptime(entry["date"], GTFS_DATE_FMT))
+    if not dates:
+        return None, None
+    return min(dates), max(dates)
+
+
+def pipeline_sources(sources):
+    """Filter the sources the pipeline can fetch, skipping invalid ones like the regular fetch does.
+
+    The pipeline downloads :url: itself, so sources which override :fetch: are skipped as well.
+    """
+    valid = []
+    for src in sources:
+        reason = skip_reason(src)
+        if reason is None:
+            valid.append(src)
+        else:
+            LOG.warning("Skipping feed %s, which %s.", getattr(src, "__name__", src), reason)
+    return valid
+
+
+def failed_status(last_stat: Dict, error: str) -> Dict:
+    """Status of a feed that could not be fetched.
+
+    Keeps the validators of the last download, so that the next run can still send a conditional
+    request, but clears validity and currency, which are unknown for this run.
+    """
+    stat = {key: value for key, value in last_stat.items() if key not in ("is_valid", "is_current")}
+    stat.update(is_new=False, newly_effective=False, error=error)
+    return stat
+
+
+def unchanged_status(
+    last_stat: Dict, download_directory: str, file_name: str, content: Optional[bytes] = None
+) -> Tuple[Dict, Optional[bytes]]:
+    """Status of a feed which has not changed since the last check.
+
+    If the last check failed, or never validated the feed, the feed is processed again. Failures
+    caused by its content will then be recorded again, while transient ones are cleared.
+
+    :param content: Content of the feed, if it was downloaded anyway
+    :returns Tuple of the feed's status and its content, which is None if it needs no processing
+    """
+    LOG.info("Feed %s has not changed since the last check.", file_name)
+    stat = {key: value for key, value in last_stat.items() if key != "error"}
+    stat["is_new"] = False
+    if "is_valid" in last_stat and "error" not in last_stat:
+        return stat, None
+    if content is not None:
+        return stat, content
+
+    feed_path = os.path.join(download_directory, file_name)
+    try:
+        with open(feed_path, "rb") as feed_file:
+            return stat, feed_file.read()
+    except OSError as ex:
+        LOG.error("Could not read feed %s: %s", file_name, ex)
+        return failed_status(last_stat, str(ex)), None
+
+
+def extend_feed_status(
+    feedzip: zipfile.ZipFile, file_name: str, stat: Dict, download_directory: str, effective_days: int
+) -> None:
+    """Extend an open feed and record the window it was extended for in its status."""
+    extend_feed_zip(
+        feedzip,
+        os.path.join(download_directory, file_name[:-4] + "_extended.zip"),
+        effective_days,
+    )
+    # feeds without calendar.txt cannot be extended, so they never need extending again
+    stat["extended_on"] = date.today() if "calendar.txt" in feedzip.namelist() else None
+    stat["extended_days"] = effective_days
+
+
+def needs_extension(stat: Dict, effective_days: int) -> bool:
+    """Whether the extension window of an unchanged feed has moved since it was last extended."""
+    return stat.get("extended_on") is not None and (
+        stat["extended_on"] != date.today() or stat.get("extended_days") != effective_days
+    )
+
+
+def is_newly_effective(last_stat: Dict, stat: Dict) -> bool:
+    """Whether the feed has become effective since the last check."""
+    return "is_current" in last_stat and not last_stat["is_current"] and stat["is_current"]
+
+
+def download_feed(src, last_stat: Dict, download_directory: str) -> Tuple[Dict, Optional[bytes]]:
+    """Download a feed into memory and save it to the download directory, if it changed.
+
+    :param src: :FeedSource: class to download
+    :param last_stat: Last recorded status of the feed
+    :param download_directory: Full path to the directory the feed is saved to
+    :returns Tuple of the feed's new status and its content, which is None if it needs no processing
+    """
+    file_name = src.__name__ + ".zip"
+    try:
+        response = requests.get(src.url, headers=conditional_headers(last_stat), timeout=TIMEOUT)
+        if response.status_code == 304:
+            return unchanged_status(last_stat, download_directory, file_name)
+        response.raise_for_status()
+    except requests.RequestException as ex:
+        LOG.error("Could not download feed %s: %s", file_name, ex)
+        return failed_status(last_stat, str(ex)), None
+
+    content = response.content
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if not is_new(etag, last_modified, len(content), last_stat):
+        return unchanged_status(last_stat, download_directory, file_name, content)
+
+    # write next to the feed first, so a failed save does not corrupt the last download
+    feed_path = os.path.join(download_directory, file_name)
+    try:
+        with open(feed_path + ".tmp", "wb") as feed_file:
+            feed_file.write(content)
+        os.replace(feed_path + ".tmp", feed_path)
+    except OSError as ex:
+        LOG.error("Could not save feed %s: %s", file_name, ex)
+        return failed_status(last_stat, str(ex)), None
+    LOG.info("Downloaded feed %s.", file_name)
+
+    stat = {"is_new": True, "etag": etag, "last_modified": last_modified, "size": len(content)}
+    return stat, content
+
+
+def process_feed(
+    file_name: str,
+    content: bytes,
+    stat: Dict,
+    last_stat: Dict,
+    download_directory: str,
+    effective_days: int,
+    warn_days: int,
+) -> None:
+    """Validate, inspect and extend a downloaded feed from memory, updating its status in place.
+
+    :param file_name: File name the feed was saved as in the download directory
+    :param content: Content of the feed's zip
+    :param stat: New status of the feed
+    :param last_stat: Last recorded status of the feed
+    :param download_directory: Full path to the directory the extended feed is saved to
+    :param effective_days: Number of days from today the feed should extend into future and past
+    :param warn_days: Warn if the feed will expire within this many days
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as feedzip:
+            names = feedzip.namelist()
+            missing = [name for name in REQUIRED_FILES if name not in names]
+            if not any(name in names for name in CALENDAR_FILES):
+                missing.append(" or ".join(CALENDAR_FILES))
+            stat["is_valid"] = not missing
+            if missing:
+                LOG.warning("Feed %s is missing required files: %s", file_name, ", ".join(missing))
+                return
+
+            stat["bbox"] = stops_bbox(feedzip)
+            stat["stats"] = {
+                name: sum(1 for _ in read_csv(feedzip, name)) for name in STATS_FILES if name in names
+            }
+            stat["effective_from"], stat["effective_to"] = effective_dates(feedzip)
+            stat["is_current"] = check_current(file_name, stat, warn_days) is not False
+            stat["newly_effective"] = is_newly_effective(last_stat, stat)
+
+            extend_feed_status(feedzip, file_name, stat, download_directory, effective_days)
+    except zipfile.BadZipfile:
+        LOG.error("Could not process zip file %s.", file_name)
+        stat["is_valid"] = False
+        stat["error"] = "Could not process zip file."
+    except (KeyError, ValueError, UnicodeDecodeError, csv.Error) as ex:
+        LOG.error("Could not read feed %s: %s", file_name, ex)
+        stat["is_valid"] = False
+        stat["error"] = f"Malformed feed: {ex}"
+
+
+def write_status(download_directory: str, src_name: str, stat: Dict, last_check: datetime) -> None:
+    """Write the status file of a feed source, in the format read by :check_status:."""
+    with open(status_path(download_directory, src_name), "wb") as statfile:
+        pickle.dump({"last_check": last_check, src_name + ".zip": stat}, statfile)
+
+
+def run_pipeline(
+    sources,
+    download_directory: str,
+    effective_days: int = EFFECTIVE_DAYS,
+    warn_days: int = WARN_DAYS,
+    download_workers: int = DOWNLOAD_WORKERS,
+    process_workers: int = PROCESS_WORKERS,
+    queue_size: int = QUEUE_SIZE,
+) -> Dict[str, Dict]:
+    """Download and process all feed sources, overlapping downloads with processing.
+
+    :param sources: List of :FeedSource: classes to fetch
+    :param download_directory: Full path to the directory for feeds and their status files
+    :param effective_days: Number of days from today the feeds should extend into future and past
+    :param warn_days: Warn if a feed will expire within this many days
+    :param download_workers: Maximum number of concurrent downloads
+    :param process_workers: Maximum number of feeds processed at once
+    :param queue_size: Maximum number of downloaded feeds waiting to be processed
+    :returns Dictionary of the statuses of all feeds, by file name
+    """
+    os.makedirs(download_directory, exist_ok=True)
+    last_check = datetime.now()
+    downloaded: queue.Queue = queue.Queue(maxsize=queue_size)
+    statuses: Dict[str, Dict] = {}
+
+    def download(src):
+        last_stat = read_last_status(download_directory, src.__name__)
+        try:
+            stat, content = download_feed(src, last_stat, download_directory)
+        except Exception as ex:
+            LOG.exception("Failed to download feed %s.", src.__name__)
+            stat, content = failed_status(last_stat, str(ex)), None
+        # blocks while the processing workers are busy, which bounds the feeds held in memory
+        downloaded.put((src.__name__, last_stat, stat, content))
+
+    def process():
+        while True:
+            item = downloaded.get()
+            if item is None:
+                return
+            src_name, last_stat, stat, content = item
+            file_name = src_name + ".zip"
+            try:
+                if content is not None:
+                    process_feed(
+                        file_name,
+                        content,
+                        stat,
+                        last_stat,
+                        download_directory,
+                        effective_days,
+                        warn_days,
+                    )
+                elif "error" not in stat and "effective_to" in stat:
+                    stat["is_current"] = check_current(file_name, stat, warn_days) is not False
+                    stat["newly_effective"] = is_newly_effective(last_stat, stat)
+                    if needs_extension(stat, effective_days):
+                        # only the central directory and calendar.txt are read, unless it is extended
+                        with zipfile.ZipFile(os.path.join(download_directory, file_name)) as feedzip:
+                            extend_feed_status(
+                                feedzip, file_name, stat, download_directory, effective_days
+                            )
+            except Exception as ex:
+                LOG.exception("Failed to process feed %s.", file_name)
+                stat["error"] = str(ex)
+            statuses[file_name] = stat
+            # a worker must never die, or the downloads waiting on the queue would block forever
+            try:
+                write_status(download_directory, src_name, stat, last_check)
+            except Exception as ex:
+                LOG.exception("Failed to write status of feed %s.", file_name)
+                stat["error"] = f"Could not write status: {ex}"
+
+    processors = [threading.Thread(target=process) for _ in range(max(1, process_workers))]
+    for processor in processors:
+        processor.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, download_workers)) as executor:
+            for future in [executor.submit(download, src) for src in pipeline_sources(sources)]:
+                future.result()
+    finally:
+        for _ in processors:
+            downloaded.put(None)
+        for processor in processors:
+            processor.join()
+
+    return statuses
@@ -0,0 +1,165 @@
+"""Check feed sources for new data without downloading anything."""
+import logging
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from ..feed_source import FeedSource
+
+# seconds to wait for a single HEAD request
+TIMEOUT = 10
+# number of HEAD requests in flight at once
+WORKERS = 32
+# responses of servers that do not allow HEAD requests, retried with a streamed GET
+HEAD_REJECTED = [403, 405, 501]
+
+LOG = logging.getLogger()
+
+
+def status_path(status_directory: str, src_name: str) -> str:
+    """Path of the pickled status file recorded for the given feed source."""
+    return os.path.join(status_directory, src_name + ".p")
+
+
+def read_last_status(status_directory: str, src_name: str) -> Dict:
+    """Read the last recorded status of the feed source's download, if any.
+
+    :param status_directory: Full path to the directory containing the status files
+    :param src_name: Name of the :FeedSource: class
+    :returns Status dictionary of the feed's zip, or an empty dictionary if never recorded.
+    """
+    path = status_path(status_directory, src_name)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "rb") as statfile:
+            statuses = pickle.load(statfile)
+    except (OSError, pickle.UnpicklingError, EOFError) as ex:
+        LOG.warning("Could not read status file %s: %s", path, ex)
+        return {}
+    if not isinstance(statuses, dict):
+        LOG.warning("Status file %s is not in dictionary format.", path)
+        return {}
+    return statuses.get(src_name + ".zip", {})
+
+
+def skip_reason(src) -> Optional[str]:
+    """Why a source cannot be checked by its :url: alone, or None if it can.
+
+    Sources which override :fetch: are skipped too, since their :url: may not be what is fetched.
+    """
+    try:
+        if not issubclass(src, FeedSource):
+            return "does not subclass FeedSource"
+        elif not isinstance(src.url, str):
+            return "has no url"
+        elif src.fetch is not FeedSource.fetch:
+            return "overrides fetch"
+    except (AttributeError, TypeError):
+        return "could not be found"
+    return None
+
+
+def conditional_headers(stat: Dict) -> Dict:
+    """Request headers asking the server to only respond with data if the feed changed."""
+    headers = {}
+    if stat.get("etag"):
+        headers["If-None-Match"] = stat["etag"]
+    if stat.get("last_modified"):
+        headers["If-Modified-Since"] = stat["last_modified"]
+    return headers
+
+
+def is_new(etag: Optional[str], last_modified: Optional[str], size: Optional[int], stat: Dict) -> bool:
+    """Compare a server's validators with the last recorded status of the feed.
+
+    Not all servers honour conditional headers, so the validators are compared here as well.
+    """
+    if etag and stat.get("etag"):
+        return etag != stat["etag"]
+    elif last_modified and stat.get("last_modified"):
+        return last_modified != stat["last_modified"] or (
+            size is not None and stat.get("size") is not None and size != stat["size"]
+        )
+    # nothing to compare against, so it would have to be downloaded
+    return True
+
+
+def check_feed(src_name: str, url: str, stat: Dict) -> Dict:
+    """Send a conditional HEAD request for a feed and compare it to its last recorded status.
+
+    If the server rejects HEAD requests, a conditional GET is sent instead, whose body is not read.
+
+    :param src_name: Name of the :FeedSource: class
+    :param url: URL the feed would be downloaded from
+    :param stat: Last recorded status with optional "etag", "last_modified" and "size" keys
+    :returns Dictionary with the feed's plan: whether it would be downloaded and its size in bytes.
+    """
+    plan = {"feed": src_name, "url": url, "is_new": None, "size": None, "error": None, "skipped": None}
+
+    headers = conditional_headers(stat)
+    try:
+        response = requests.head(url, headers=headers, timeout=TIMEOUT, allow_redirects=True)
+        if response.status_code in HEAD_REJECTED:
+            LOG.debug("HEAD rejected for %s with HTTP %s, trying GET.", url, response.status_code)
+            response = requests.get(url, headers=headers, timeout=TIMEOUT, stream=True)
+            response.close()
+    except requests.RequestException as ex:
+        plan["error"] = str(ex)
+        return plan
+
+    if response.status_code == 304:
+        plan["is_new"] = False
+        plan["size"] = stat.get("size")
+        return plan
+    if not response.ok:
+        plan["error"] = f"HTTP {response.status_code}"
+        return plan
+
+    size: Optional[int] = None
+    try:
+        size = int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        pass
+    plan["size"] = size
+    plan["is_new"] = is_new(
+        response.headers.get("ETag"), response.headers.get("Last-Modified"), size, stat
+    )
+
+    return plan
+
+
+def plan_feeds(sources, status_directory: str, workers: int = WORKERS) -> List[Dict]:
+    """Check all feed sources concurrently for new data.
+
+    :param sources: List of :FeedSource: classes to check
+    :param status_directory: Full path to the directory containing the status files
+    :param workers: Maximum number of concurrent HEAD requests
+    :returns List of plan dictionaries, in the order of the passed sources
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources) or 1))) as executor:
+        plans = []
+        for src in sources:
+            reason = skip_reason(src)
+            if reason is not None:
+                LOG.warning("Skipping feed %s, which %s.", getattr(src, "__name__", src), reason)
+                plans.append(
+                    {
+                        "feed": getattr(src, "__name__", str(src)),
+                        "url": None,
+                        "is_new": None,
+                        "size": None,
+                        "error": None,
+                        "skipped": reason,
+                    }
+                )
+                continue
+            plans.append(
+                executor.submit(
+                    check_feed, src.__name__, src.url, read_last_status(status_directory, src.__name__)
+                )
+            )
+        return [plan if isinstance(plan, dict) else plan.result() for plan in plans]
@@ -0,0 +1,34 @@
+import pytest
+import requests
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.ok = status_code < 400
+        self.closed = False
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def patch_requests(monkeypatch):
+    # answers every request of the given method with the response, an exception to raise, or
+    # the result of a function of the requested URL
+    def patch(method, response):
+        def fake_request(url, **kwargs):
+            result = response(url) if callable(response) else response
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        monkeypatch.setattr(requests, method, fake_request)
+
+    return patch
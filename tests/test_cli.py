@@ -1,6 +1,10 @@
+import json
+
 import pytest
+from conftest import FakeResponse
 from typer.testing import CliRunner
 
+from gtfs import __main__
 from gtfs.__main__ import app
 
 
@@ -45,3 +49,64 @@ class TestListFeedsCommand:
     def test_pretty(self, runner):
         result = runner.invoke(app, ["list-feeds", "-pt"])
         assert result.exit_code == 0
+
+
+class TestFetchFeedsCommand:
+    def test_plan_help(self, runner):
+        result = runner.invoke(app, ["fetch-feeds", "--help"])
+        assert result.exit_code == 0
+        assert "--plan" in result.stdout
+
+    @pytest.fixture
+    def head(self, patch_requests):
+        # Berlin reports its size, AlbanyNy does not
+        patch_requests(
+            "head",
+            lambda url: FakeResponse(headers={"Content-Length": "100"} if "vbb.de" in url else {}),
+        )
+
+    def test_plan_json(self, runner, head, tmp_path):
+        result = runner.invoke(app, ["fetch-feeds", "--plan", "--json", "-d", str(tmp_path)])
+        assert result.exit_code == 0
+        output = json.loads(result.stdout)
+        assert [feed["feed"] for feed in output["feeds"]] == ["Berlin", "AlbanyNy"]
+        assert all(feed["is_new"] for feed in output["feeds"])
+        assert output["total_bytes"] == 100
+        assert output["unknown_size"] == 1
+
+    def test_plan_table(self, runner, head, tmp_path):
+        result = runner.invoke(app, ["fetch-feeds", "--plan", "-d", str(tmp_path)])
+        assert result.exit_code == 0
+        assert "Berlin" in result.stdout
+        assert "Estimated bytes to transfer: 100" in result.stdout
+        assert "Not included: 1 new feed(s) of unknown size" in result.stdout
+
+    def test_pipeline(self, runner, monkeypatch, tmp_path):
+        calls = []
+
+        def fake_run_pipeline(sources, download_directory, effective_days, warn_days):
+            calls.append((download_directory, effective_days, warn_days))
+            return {"Berlin.zip": {"is_new": True, "is_valid": True}}
+
+        monkeypatch.setattr(__main__, "run_pipeline", fake_run_pipeline)
+        result = runner.invoke(app, ["fetch-feeds", "--pipeline", "-e", "10", "-d", str(tmp_path)])
+        assert result.exit_code == 0
+        assert calls == [(str(tmp_path), 10, 30)]
+
+    @pytest.mark.parametrize(
+        # 1. plan and pipeline at once;
+        # 2. json without plan;
+        # 3. extend days without pipeline;
+        # 4. warn expiry days without pipeline;
+        "args, message",
+        [
+            (["--plan", "--pipeline"], "either --plan or --pipeline"),
+            (["--json"], "Please pass --plan"),
+            (["--extend-days", "10"], "Please pass --pipeline"),
+            (["--plan", "--warn-expiry-days", "10"], "Please pass --pipeline"),
+        ],
+    )
+    def test_bad_flag_combinations(self, runner, args, message):
+        result = runner.invoke(app, ["fetch-feeds", *args])
+        assert result.exit_code == 2
+        assert message in result.stdout
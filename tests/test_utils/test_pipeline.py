@@ -0,0 +1,233 @@
+import io
+import pickle
+import threading
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import FakeResponse
+
+from gtfs.feed_source import FeedSource
+from gtfs.utils import pipeline
+from gtfs.utils.geom import Bbox
+from gtfs.utils.pipeline import pipeline_sources, run_pipeline
+from gtfs.utils.plan import read_last_status
+
+GTFS_FILES = {
+    "agency.txt": "agency_id,agency_name,agency_url,agency_timezone\n1,Agency,http://a.b,Europe/Berlin\n",
+    "stops.txt": "stop_id,stop_name,stop_lat,stop_lon\n1,A,52.5,13.3\n2,B,52.6,13.5\n",
+    "routes.txt": "route_id,route_type\n1,3\n",
+    "trips.txt": "route_id,service_id,trip_id\n1,1,1\n",
+    "stop_times.txt": "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n1,08:00:00,08:00:00,1,1\n",
+}
+
+
+def make_feed(start_date, end_date, exclude=()):
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w") as feedzip:
+        for name, text in GTFS_FILES.items():
+            if name not in exclude:
+                feedzip.writestr(name, text)
+        feedzip.writestr(
+            "calendar.txt",
+            "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+            f"1,1,1,1,1,1,1,1,{start_date:%Y%m%d},{end_date:%Y%m%d}\n",
+        )
+    return content.getvalue()
+
+
+class FakeSource(FeedSource):
+    url = "https://example.com/gtfs.zip"
+    bbox = Bbox(13.3, 52.5, 13.5, 52.6)
+
+
+def read_status(directory):
+    with open(directory / "FakeSource.p", "rb") as statfile:
+        return pickle.load(statfile)["FakeSource.zip"]
+
+
+class TestRunPipeline:
+    def test_new_feed(self, patch_requests, tmp_path):
+        today = datetime.today()
+        content = make_feed(today - timedelta(days=10), today + timedelta(days=100))
+        patch_requests("get", FakeResponse(200, content, {"ETag": '"abc"'}))
+
+        statuses = run_pipeline([FakeSource], str(tmp_path), effective_days=365, warn_days=30)
+
+        stat = statuses["FakeSource.zip"]
+        assert stat == read_status(tmp_path)
+        assert stat["is_new"] is True
+        assert stat["is_valid"] is True
+        assert stat["is_current"] is True
+        assert stat["etag"] == '"abc"'
+        assert stat["size"] == len(content)
+        assert stat["bbox"] == Bbox(13.3, 52.5, 13.5, 52.6)
+        assert stat["stats"]["stops.txt"] == 2
+        assert (tmp_path / "FakeSource.zip").read_bytes() == content
+        with zipfile.ZipFile(tmp_path / "FakeSource_extended.zip") as extzip:
+            assert "stop_times.txt" in extzip.namelist()
+            assert f"{today + timedelta(days=365):%Y%m%d}" in extzip.read("calendar.txt").decode()
+
+    def test_not_modified(self, patch_requests, tmp_path):
+        today = datetime.today()
+        patch_requests(
+            "get", FakeResponse(200, make_feed(today, today + timedelta(days=100)), {"ETag": '"abc"'})
+        )
+        run_pipeline([FakeSource], str(tmp_path))
+
+        patch_requests("get", FakeResponse(304))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert stat["is_new"] is False
+        assert stat["is_valid"] is True
+        assert stat["etag"] == '"abc"'
+
+    def test_invalid_feed(self, patch_requests, tmp_path):
+        today = datetime.today()
+        patch_requests("get", FakeResponse(200, make_feed(today, today, exclude=["stops.txt"])))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert stat["is_valid"] is False
+
+    def test_bad_zip(self, patch_requests, tmp_path):
+        patch_requests("get", FakeResponse(200, b"not a zip"))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert stat["is_valid"] is False
+        assert "error" in stat
+
+    def test_download_error(self, patch_requests, tmp_path):
+        patch_requests("get", FakeResponse(500))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert stat["error"] == "HTTP 500"
+
+    def test_transient_error(self, patch_requests, tmp_path):
+        today = datetime.today()
+        patch_requests(
+            "get", FakeResponse(200, make_feed(today, today + timedelta(days=100)), {"ETag": '"abc"'})
+        )
+        run_pipeline([FakeSource], str(tmp_path))
+
+        patch_requests("get", FakeResponse(503))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert stat["error"] == "HTTP 503"
+        assert "is_valid" not in stat
+        assert read_last_status(str(tmp_path), "FakeSource")["etag"] == '"abc"'
+
+        # validity is unknown after the failed check, so the saved feed is processed again
+        patch_requests("get", FakeResponse(304))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert "error" not in stat
+        assert stat["is_new"] is False
+        assert stat["is_valid"] is True
+        assert stat["is_current"] is True
+        assert stat["etag"] == '"abc"'
+
+    @pytest.mark.parametrize("status", [304, 200])
+    def test_failure_after_validation(self, patch_requests, monkeypatch, tmp_path, status):
+        def fail(*args):
+            raise OSError("disk full")
+
+        today = datetime.today()
+        content = make_feed(today, today + timedelta(days=100))
+        patch_requests("get", FakeResponse(200, content, {"ETag": '"abc"'}))
+        with monkeypatch.context() as patch:
+            patch.setattr(pipeline, "extend_feed_zip", fail)
+            stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert stat["is_valid"] is True
+        assert stat["error"] == "disk full"
+        assert not (tmp_path / "FakeSource_extended.zip").exists()
+
+        # an unchanged download is processed from memory, a 304 from the saved feed
+        if status == 200:
+            (tmp_path / "FakeSource.zip").unlink()
+        patch_requests("get", FakeResponse(status, content, {"ETag": '"abc"'}))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert "error" not in stat
+        assert (tmp_path / "FakeSource_extended.zip").exists()
+
+    def test_content_error_kept(self, patch_requests, tmp_path):
+        patch_requests("get", FakeResponse(200, b"not a zip", {"ETag": '"abc"'}))
+        run_pipeline([FakeSource], str(tmp_path))
+
+        patch_requests("get", FakeResponse(304))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert stat["is_valid"] is False
+        assert stat["error"] == "Could not process zip file."
+
+    def test_unchanged_extended_again(self, patch_requests, tmp_path):
+        today = datetime.today()
+        patch_requests(
+            "get", FakeResponse(200, make_feed(today, today + timedelta(days=100)), {"ETag": '"abc"'})
+        )
+        run_pipeline([FakeSource], str(tmp_path), effective_days=365)
+        (tmp_path / "FakeSource_extended.zip").unlink()
+
+        # same day and window, nothing to extend
+        patch_requests("get", FakeResponse(304))
+        run_pipeline([FakeSource], str(tmp_path), effective_days=365)
+        assert not (tmp_path / "FakeSource_extended.zip").exists()
+
+        # last extended yesterday, so the window has moved
+        with open(tmp_path / "FakeSource.p", "rb") as statfile:
+            status = pickle.load(statfile)
+        status["FakeSource.zip"]["extended_on"] -= timedelta(days=1)
+        with open(tmp_path / "FakeSource.p", "wb") as statfile:
+            pickle.dump(status, statfile)
+        stat = run_pipeline([FakeSource], str(tmp_path), effective_days=365)["FakeSource.zip"]
+        assert stat["extended_on"] == today.date()
+        assert (tmp_path / "FakeSource_extended.zip").exists()
+
+        stat = run_pipeline([FakeSource], str(tmp_path), effective_days=400)["FakeSource.zip"]
+        assert stat["extended_days"] == 400
+        with zipfile.ZipFile(tmp_path / "FakeSource_extended.zip") as extzip:
+            assert f"{today + timedelta(days=400):%Y%m%d}" in extzip.read("calendar.txt").decode()
+
+    def test_unchanged_newly_effective(self, patch_requests, tmp_path):
+        today = datetime.today()
+        last_stat = {
+            "etag": '"abc"',
+            "is_valid": True,
+            "is_current": False,
+            "effective_from": today - timedelta(days=1),
+            "effective_to": today + timedelta(days=100),
+        }
+        with open(tmp_path / "FakeSource.p", "wb") as statfile:
+            pickle.dump({"last_check": today - timedelta(days=2), "FakeSource.zip": last_stat}, statfile)
+
+        patch_requests("get", FakeResponse(304))
+        stat = run_pipeline([FakeSource], str(tmp_path))["FakeSource.zip"]
+        assert stat["is_current"] is True
+        assert stat["newly_effective"] is True
+
+    def test_failing_status_write_does_not_hang(self, patch_requests, monkeypatch, tmp_path):
+        def fail(*args):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(pipeline, "write_status", fail)
+        patch_requests("get", FakeResponse(500))
+        sources = [type(f"FakeSource{i}", (FakeSource,), {}) for i in range(5)]
+        statuses = {}
+
+        def run():
+            statuses.update(
+                run_pipeline(sources, str(tmp_path), download_workers=5, process_workers=1, queue_size=1)
+            )
+
+        runner = threading.Thread(target=run, daemon=True)
+        runner.start()
+        runner.join(timeout=10)
+        assert not runner.is_alive()
+        assert len(statuses) == 5
+        assert all("disk full" in stat["error"] for stat in statuses.values())
+
+
+class NotAFeedSource:
+    url = "https://example.com/gtfs.zip"
+
+
+class CustomFetch(FakeSource):
+    def fetch(self):
+        pass
+
+
+class TestPipelineSources:
+    def test_skips_invalid_sources(self):
+        assert pipeline_sources([FakeSource, NotAFeedSource, CustomFetch, "missing"]) == [FakeSource]
@@ -0,0 +1,105 @@
+import pickle
+
+import pytest
+import requests
+from conftest import FakeResponse
+
+from gtfs.feed_source import FeedSource
+from gtfs.utils.geom import Bbox
+from gtfs.utils.plan import check_feed, plan_feeds, read_last_status
+
+
+class FakeSource(FeedSource):
+    url = "https://example.com/gtfs.zip"
+    bbox = Bbox(0, 0, 10, 10)
+
+
+class NotAFeedSource:
+    pass
+
+
+class CustomFetch(FakeSource):
+    def fetch(self):
+        pass
+
+
+class TestCheckFeed:
+    def test_not_modified(self, patch_requests):
+        patch_requests("head", FakeResponse(304))
+        result = check_feed("Feed", FakeSource.url, {"etag": '"abc"', "size": 10})
+        assert result["is_new"] is False
+        assert result["size"] == 10
+
+    @pytest.mark.parametrize(
+        # 1. same etag, server ignored the conditional header;
+        # 2. changed etag;
+        # 3. same last-modified and size;
+        # 4. same last-modified but different size;
+        # 5. nothing recorded yet;
+        "headers, stat, is_new",
+        [
+            ({"ETag": '"abc"'}, {"etag": '"abc"'}, False),
+            ({"ETag": '"def"'}, {"etag": '"abc"'}, True),
+            (
+                {"Last-Modified": "Mon", "Content-Length": "10"},
+                {"last_modified": "Mon", "size": 10},
+                False,
+            ),
+            (
+                {"Last-Modified": "Mon", "Content-Length": "12"},
+                {"last_modified": "Mon", "size": 10},
+                True,
+            ),
+            ({"Content-Length": "10"}, {}, True),
+        ],
+    )
+    def test_compare_validators(self, patch_requests, headers, stat, is_new):
+        patch_requests("head", FakeResponse(200, headers=headers))
+        assert check_feed("Feed", FakeSource.url, stat)["is_new"] is is_new
+
+    def test_head_rejected(self, patch_requests):
+        patch_requests("head", FakeResponse(405))
+        response = FakeResponse(200, headers={"ETag": '"abc"', "Content-Length": "10"})
+        patch_requests("get", response)
+        result = check_feed("Feed", FakeSource.url, {"etag": '"abc"'})
+        assert result["is_new"] is False
+        assert result["size"] == 10
+        assert response.closed is True
+
+    def test_http_error(self, patch_requests):
+        patch_requests("head", FakeResponse(404))
+        result = check_feed("Feed", FakeSource.url, {})
+        assert result["is_new"] is None
+        assert result["error"] == "HTTP 404"
+
+    def test_request_error(self, patch_requests):
+        patch_requests("head", requests.ConnectionError("unreachable"))
+        result = check_feed("Feed", FakeSource.url, {})
+        assert result["is_new"] is None
+        assert "unreachable" in result["error"]
+
+
+class TestPlanFeeds:
+    def test_reads_last_status(self, patch_requests, tmp_path):
+        with open(tmp_path / "FakeSource.p", "wb") as statfile:
+            pickle.dump({"last_check": None, "FakeSource.zip": {"etag": '"abc"', "size": 10}}, statfile)
+        assert read_last_status(str(tmp_path), "FakeSource") == {"etag": '"abc"', "size": 10}
+
+        patch_requests("head", FakeResponse(200, headers={"ETag": '"abc"', "Content-Length": "10"}))
+        plans = plan_feeds([FakeSource], str(tmp_path))
+        assert [p["feed"] for p in plans] == ["FakeSource"]
+        assert plans[0]["is_new"] is False
+
+    def test_missing_status(self, tmp_path):
+        assert read_last_status(str(tmp_path), "FakeSource") == {}
+
+    def test_skipped_sources(self, patch_requests, tmp_path):
+        patch_requests("head", FakeResponse(200))
+        plans = plan_feeds([FakeSource, NotAFeedSource, CustomFetch, "missing"], str(tmp_path))
+        assert [p["skipped"] for p in plans] == [
+            None,
+            "does not subclass FeedSource",
+            "overrides fetch",
+            "could not be found",
+        ]
+        assert plans[0]["is_new"] is True